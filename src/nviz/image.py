@@ -4,17 +4,331 @@ Experiment with GFF image stacks to OME-ZARR with display in Napari.
 
 import os
 import pathlib
-from itertools import groupby
-from typing import Dict, List, Optional, Tuple, Union
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 
 import numpy as np
 import tifffile as tiff
 import zarr
+from numcodecs import Blosc
 from ome_zarr.io import parse_url as zarr_parse_url
+from ome_zarr.scale import Scaler
 from ome_zarr.writer import write_image as zarr_write_image
 
 from .image_meta import extract_z_slice_number_from_filename, generate_ome_xml
 
+# upper bound on the number of threads used to read z-slices concurrently
+MAX_READ_WORKERS = 16
+
+# upper bounds for the z-depth of Zarr chunks and
+# the (y, x) size of Zarr chunks and OME-TIFF tiles
+CHUNK_DEPTH = 16
+TILE_SIZE = 512
+
+# upper bound on the number of downsampled layers written below
+# the full resolution data within OME-Zarr multiscale pyramids
+MAX_PYRAMID_LAYERS = 4
+
+# z, y, and x spatial axes shared by every OME-Zarr multiscale pyramid
+ZARR_AXES = [{"name": name, "unit": "micrometer", "type": "space"} for name in "zyx"]
+
+
+def _zarr_chunks(shape: Tuple[int, ...]) -> Tuple[int, ...]:
+    """
+    Determine the Zarr chunk shape for a (z, y, x) array.
+
+    Args:
+        shape (Tuple[int, ...]):
+            Shape of the array to be written.
+
+    Returns:
+        Tuple[int, ...]:
+            Chunk shape bounded by CHUNK_DEPTH and TILE_SIZE.
+    """
+    return (
+        min(CHUNK_DEPTH, shape[0]),
+        min(TILE_SIZE, shape[1]),
+        min(TILE_SIZE, shape[2]),
+    )
+
+
+def _tiff_tile(shape: Tuple[int, ...]) -> Tuple[int, int]:
+    """
+    Determine the TIFF tile shape for an array ending in (y, x).
+
+    Args:
+        shape (Tuple[int, ...]):
+            Shape of the array to be written.
+
+    Returns:
+        Tuple[int, int]:
+            Tile shape bounded by TILE_SIZE. TIFF tiles must be
+            a multiple of 16 so smaller images are rounded up.
+    """
+    return tuple(min(TILE_SIZE, -(-dim // 16) * 16) for dim in shape[-2:])
+
+
+def _zstack_shape(files: List[os.DirEntry]) -> Tuple[int, ...]:
+    """
+    Determine the shape of a z-stack without reading pixel data.
+
+    Args:
+        files (List[os.DirEntry]):
+            TIFF files for a single channel, ordered by z-slice.
+
+    Returns:
+        Tuple[int, ...]:
+            The (z, y, x) shape of the z-stack, assuming all
+            slices share the shape of the first slice.
+    """
+    return (len(files), *_tiff_shape(files[0].path))
+
+
+def _tiff_shape(path: str) -> Tuple[int, ...]:
+    """
+    Determine the shape of a TIFF file without reading pixel data.
+
+    Args:
+        path (str):
+            Path to a TIFF file.
+
+    Returns:
+        Tuple[int, ...]:
+            The shape of the first series within the TIFF file.
+    """
+    with tiff.TiffFile(path) as tif:
+        return tif.series[0].shape
+
+
+def _read_zstack(
+    files: List[os.DirEntry],
+    executor: ThreadPoolExecutor,
+    out: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Read z-slice TIFF files into a single uint16 z-stack.
+
+    Slices are read concurrently into a preallocated array
+    so that no intermediate list of slices is kept in memory.
+
+    Args:
+        files (List[os.DirEntry]):
+            TIFF files for a single channel, ordered by z-slice.
+        executor (ThreadPoolExecutor):
+            Thread pool used to read slices concurrently. A single
+            pool is shared across channels to avoid restarting threads.
+        out (Optional[np.ndarray]):
+            A uint16 array to reuse for the z-stack, for example
+            the result of reading a previous channel. A new array
+            is allocated if None or if the shape does not match.
+
+    Returns:
+        np.ndarray:
+            A z-stack array with shape (z, y, x).
+    """
+    zstack_shape = _zstack_shape(files)
+    if out is not None and out.shape == zstack_shape:
+        zstack = out
+    else:
+        zstack = np.empty(zstack_shape, dtype=np.uint16)
+
+    def read_slice(index: int, file: os.DirEntry) -> None:
+        # use a single tifffile worker per slice to avoid
+        # oversubscribing threads alongside the shared pool
+        with tiff.TiffFile(file.path) as tif:
+            if tif.series[0].dtype == zstack.dtype:
+                # decode directly into the z-stack without a temporary copy
+                tif.asarray(out=zstack[index], maxworkers=1)
+            else:
+                zstack[index] = tif.asarray(maxworkers=1)
+
+    # consume the results so that any read errors are raised
+    list(executor.map(read_slice, range(len(files)), files))
+
+    return zstack
+
+
+def _iter_tiles(stack: np.ndarray, tile: Tuple[int, int]) -> Iterator[np.ndarray]:
+    """
+    Iterate over the tiles of a z-stack in TIFF storage order.
+
+    Args:
+        stack (np.ndarray):
+            A z-stack array with shape (z, y, x).
+        tile (Tuple[int, int]):
+            The (y, x) shape of each tile.
+
+    Yields:
+        np.ndarray:
+            Tiles ordered by plane, then row, then column.
+            Tiles along the edges may be smaller than the tile shape.
+    """
+    for plane in stack:
+        for y in range(0, plane.shape[0], tile[0]):
+            for x in range(0, plane.shape[1], tile[1]):
+                yield plane[y : y + tile[0], x : x + tile[1]]
+
+
+def _read_label_volume(path: str, memmap: bool = True) -> np.ndarray:
+    """
+    Read a label volume TIFF file as a uint16 array.
+
+    Label files are memory-mapped where possible so that
+    the volume is not copied into memory up front.
+
+    Args:
+        path (str):
+            Path to a label TIFF file.
+        memmap (bool):
+            Whether to return a read-only memory-mapped array
+            where possible instead of a writable in-memory array.
+            Defaults to True.
+
+    Returns:
+        np.ndarray:
+            A label array with shape (z, y, x).
+    """
+    if not memmap:
+        return tiff.imread(path).astype(np.uint16, copy=False)
+
+    try:
+        volume = tiff.memmap(path, mode="r")
+    except ValueError:
+        # compressed or non-contiguous image data cannot be memory-mapped
+        volume = tiff.imread(path)
+
+    # only copies when the dtype differs from uint16
+    return volume.astype(np.uint16, copy=False)
+
+
+def _write_zarr_pyramid(
+    stack: np.ndarray,
+    group: zarr.Group,
+    coordinate_transformations: List[List[Dict]],
+    storage_options: Dict,
+) -> None:
+    """
+    Write a z-stack to a Zarr group as a multiscale pyramid.
+
+    Each layer halves the y and x dimensions of the previous layer
+    using nearest-neighbor downsampling, which also keeps label
+    values intact.
+
+    Args:
+        stack (np.ndarray):
+            A z-stack array with shape (z, y, x).
+        group (zarr.Group):
+            The Zarr group to write the pyramid and its metadata to.
+        coordinate_transformations (List[List[Dict]]):
+            Scale transformations for each possible layer of the
+            pyramid, of which only the layers written are used.
+        storage_options (Dict):
+            Storage options applied to every layer of the pyramid.
+    """
+    # stop downsampling before y or x would shrink below one pixel
+    layers = min(MAX_PYRAMID_LAYERS, int(np.log2(min(stack.shape[1:]))))
+    layer_factors = [2**layer for layer in range(layers + 1)]
+
+    zarr_write_image(
+        image=stack,
+        group=group,
+        axes=ZARR_AXES,
+        scaler=Scaler(max_layer=layers, method="nearest") if layers else None,
+        # write the multiscales metadata once alongside the pyramid itself
+        coordinate_transformations=coordinate_transformations[: layers + 1],
+        # chunk each layer based on its own shape
+        storage_options=[
+            {
+                **storage_options,
+                "chunks": _zarr_chunks(
+                    (
+                        stack.shape[0],
+                        stack.shape[1] // factor,
+                        stack.shape[2] // factor,
+                    )
+                ),
+            }
+            for factor in layer_factors
+        ],
+    )
+    # Set the units attribute for the group to "micrometers"
+    group.attrs["units"] = "micrometers"
+
+
+def _image_set_to_files(
+    image_dir: str,
+    channel_map: Dict[str, str],
+    label_dir: Optional[str] = None,
+    ignore: Optional[List[str]] = ["Merge"],
+) -> Dict[str, Dict[str, Union[List[os.DirEntry], os.DirEntry]]]:
+    """
+    Gather the files which make up a set of images
+    without reading any image data.
+    Files are split into "images" and "labels" following
+    the same convention as image_set_to_arrays.
+
+    Args:
+        image_dir (str):
+            Directory containing TIFF image files.
+        channel_map (Dict[str, str]):
+            Mapping from filename codes to channel names.
+        label_dir (Optional[str]):
+            Directory containing label TIFF files. Defaults to None.
+        ignore (Optional[List[str]]):
+            List of filename codes to ignore.
+            Defaults to ["Merge"], which is a
+            code for merged images.
+
+    Returns:
+        Dict[str, Dict[str, Union[List[os.DirEntry], os.DirEntry]]]:
+            A dictionary containing two keys: "images" and "labels".
+            "images" maps channel names to files ordered by z-slice
+            and "labels" maps label names to a single file.
+    """
+    # group files by channel code in a single pass,
+    # parsing each filename once
+    image_files = defaultdict(list)
+    for file in os.scandir(image_dir):
+        if not file.name.endswith((".tif", ".tiff")):
+            continue
+        filename_code = file.name.split("_", 2)[1]
+        if ignore is not None and filename_code in ignore:
+            continue
+        image_files[filename_code].append(
+            (extract_z_slice_number_from_filename(file.name), file)
+        )
+
+    # build a reference to the observations,
+    # ordering channels by code and files by z-slice
+    frame_files = {
+        "images": {
+            channel_map.get(filename_code, f"Unknown_{filename_code}"): [
+                file for _, file in sorted(entries, key=lambda entry: entry[0])
+            ]
+            for filename_code, entries in sorted(image_files.items())
+        }
+    }
+
+    if label_dir:
+        label_files = {}
+        for file in os.scandir(label_dir):
+            if not file.name.endswith((".tif", ".tiff")):
+                continue
+            label_name = file.name.split("_", 1)[0]
+            if ignore is not None and label_name in ignore:
+                continue
+            # use the first file found for each label name
+            label_files.setdefault(label_name, file)
+
+        frame_files["labels"] = {
+            f"{os.path.splitext(label_name)[0]} (labels)": file
+            for label_name, file in sorted(label_files.items())
+        }
+
+    return frame_files
+
 
 def image_set_to_arrays(
     image_dir: str,
@@ -50,58 +364,23 @@ def image_set_to_arrays(
             Each key maps to another dictionary where the keys are
             channel names and the values are numpy arrays of images.
     """
-    # build a reference to the observations
-    zstack_arrays = {
-        "images": {
-            channel_map.get(filename_code, f"Unknown_{filename_code}"): np.stack(
-                [
-                    tiff.imread(tiff_file.path).astype(np.uint16)
-                    for tiff_file in sorted(
-                        files,
-                        key=lambda x: extract_z_slice_number_from_filename(x.name),
-                    )
-                ]
-            ).astype(np.uint16)
-            for filename_code, files in groupby(
-                sorted(
-                    [
-                        file
-                        for file in os.scandir(image_dir)
-                        if (file.name.endswith(".tif") or file.name.endswith(".tiff"))
-                        and (
-                            file.name.split("_")[1] not in ignore
-                            if ignore is not None
-                            else True
-                        )
-                    ],
-                    key=lambda x: x.name.split("_")[1],
-                ),
-                key=lambda x: x.name.split("_")[1],
-            )
+    frame_files = _image_set_to_files(
+        image_dir=image_dir, label_dir=label_dir, channel_map=channel_map, ignore=ignore
+    )
+
+    with ThreadPoolExecutor(max_workers=MAX_READ_WORKERS) as executor:
+        zstack_arrays = {
+            "images": {
+                channel: _read_zstack(files, executor)
+                for channel, files in frame_files["images"].items()
+            }
         }
-    }
 
     if label_dir:
         zstack_arrays["labels"] = {
-            f"{pathlib.Path(label_name).stem} (labels)": tiff.imread(
-                next(iter(file)).path
-            ).astype(np.uint16)
-            for label_name, file in groupby(
-                sorted(
-                    [
-                        file
-                        for file in os.scandir(label_dir)
-                        if (file.name.endswith(".tif") or file.name.endswith(".tiff"))
-                        and (
-                            file.name.split("_")[0] not in ignore
-                            if ignore is not None
-                            else True
-                        )
-                    ],
-                    key=lambda x: x.name.split("_")[0],
-                ),
-                key=lambda x: x.name.split("_")[0],
-            )
+            # read labels into writable in-memory arrays for callers
+            compartment_name: _read_label_volume(file.path, memmap=False)
+            for compartment_name, file in frame_files["labels"].items()
         }
 
     return zstack_arrays
@@ -151,7 +430,8 @@ def tiff_to_zarr(  # noqa: PLR0913
         raise NotADirectoryError(f"Image directory {image_dir} does not exist.")
 
     # build a reference to the observations
-    frame_zstacks = image_set_to_arrays(
+    # (image data are read one channel at a time below)
+    frame_files = _image_set_to_files(
         image_dir=image_dir, label_dir=label_dir, channel_map=channel_map, ignore=ignore
     )
 
@@ -160,73 +440,58 @@ def tiff_to_zarr(  # noqa: PLR0913
     # Ensure we are working with a Zarr group
     root = zarr.group(store, overwrite=True)
 
-    # create scaling metadata
-    scale_metadata = [
-        {
-            "datasets": [
-                {
-                    "path": "0",  # Path to the dataset
-                    "coordinateTransformations": [
-                        {
-                            "type": "scale",
-                            "scale": list(scaling_values),
-                        }  # Apply scaling values
-                    ],
-                }
-            ],
-            "axes": [
-                {
-                    "name": "z",
-                    "unit": "micrometer",
-                    "type": "space",
-                },  # Define the z-axis
-                {
-                    "name": "y",
-                    "unit": "micrometer",
-                    "type": "space",
-                },  # Define the y-axis
-                {
-                    "name": "x",
-                    "unit": "micrometer",
-                    "type": "space",
-                },  # Define the x-axis
-            ],
-        }
+    # compress chunks using Blosc with zstd and bit-shuffling,
+    # which performs well for sparse 16-bit image data
+    storage_options = {
+        "compressor": Blosc(cname="zstd", clevel=3, shuffle=Blosc.BITSHUFFLE)
+    }
+
+    # build the scaling for every possible pyramid layer once
+    # as it is shared by all channels and labels
+    coordinate_transformations = [
+        [
+            {
+                "type": "scale",
+                "scale": [
+                    scaling_values[0],
+                    scaling_values[1] * 2**layer,
+                    scaling_values[2] * 2**layer,
+                ],
+            }
+        ]
+        for layer in range(MAX_PYRAMID_LAYERS + 1)
     ]
 
-    # Write each channel separately to the Zarr file with no compression
+    # Write each channel separately to the Zarr file
     # Save images to OME-Zarr format
     images_group = root.create_group("images")
-    for channel, stack in frame_zstacks["images"].items():
-        zarr_write_image(
-            image=stack,
-            group=(group := images_group.create_group(channel)),
-            axes="zyx",  # Specify the axes order for each channel
-            dtype="uint16",  # Ensure the dtype is set correctly
-            scaler=None,  # Disable scaler
-        )
-        # Set the units attribute for the group to "micrometers"
-        group.attrs["units"] = "micrometers"
+    # share a single thread pool for reading slices across all channels
+    with ThreadPoolExecutor(max_workers=MAX_READ_WORKERS) as executor:
+        stack = None
+        for channel, files in frame_files["images"].items():
+            # reuse the previous channel's buffer as it has already been written
+            stack = _read_zstack(files, executor, out=stack)
+            _write_zarr_pyramid(
+                stack=stack,
+                group=images_group.create_group(channel),
+                coordinate_transformations=coordinate_transformations,
+                storage_options=storage_options,
+            )
 
-        # Define the multiscales metadata for the group
-        group.attrs["multiscales"] = scale_metadata
+    del stack
 
     if label_dir:
         # Save masks to OME-Zarr format
         labels_group = root.create_group("labels")
-        for compartment_name, stack in frame_zstacks["labels"].items():
-            zarr_write_image(
-                image=stack,
-                group=(group := labels_group.create_group(compartment_name)),
-                axes="zyx",  # Specify the axes order for each mask
-                dtype="uint16",  # Ensure the dtype is set correctly
-                scaler=None,  # Disable scaler
+        for compartment_name, file in frame_files["labels"].items():
+            stack = _read_label_volume(file.path)
+            _write_zarr_pyramid(
+                stack=stack,
+                group=labels_group.create_group(compartment_name),
+                coordinate_transformations=coordinate_transformations,
+                storage_options=storage_options,
             )
-            # Set the units attribute for the group to "micrometers"
-            group.attrs["units"] = "micrometers"
-
-            # Define the multiscales metadata for the group
-            group.attrs["multiscales"] = scale_metadata
+            del stack
 
     return output_path
 
@@ -274,43 +539,61 @@ def tiff_to_ometiff(  # noqa: PLR0913
     if not pathlib.Path(image_dir).is_dir():
         raise NotADirectoryError(f"Image directory {image_dir} does not exist.")
 
-    frame_zstacks = image_set_to_arrays(
+    # build a reference to the observations
+    # (image data are read one channel at a time while writing)
+    frame_files = _image_set_to_files(
         image_dir=image_dir, label_dir=label_dir, channel_map=channel_map, ignore=ignore
     )
+    label_files = frame_files["labels"] if label_dir else {}
+
+    if not frame_files["images"]:
+        raise ValueError(f"No image channels found within {image_dir}.")
+
+    # check the shape of every channel before writing so that a
+    # mismatch does not leave a partially written file behind
+    channel_shapes = {
+        **{
+            channel: _zstack_shape(files)
+            for channel, files in frame_files["images"].items()
+        },
+        **{
+            compartment_name: _tiff_shape(file.path)
+            for compartment_name, file in label_files.items()
+        },
+    }
+    zstack_shape = next(iter(channel_shapes.values()))
+    for channel, shape in channel_shapes.items():
+        if shape != zstack_shape:
+            raise ValueError(
+                f"Channel {channel} has shape {shape} "
+                f"which does not match the expected shape {zstack_shape}."
+            )
 
-    # Prepare the data for writing
-    images_data = []
-    labels_data = []
-    channel_names = []
-    label_names = []
-
-    # Collect image data
-    for channel, stack in frame_zstacks["images"].items():
-        images_data.append(stack)
-        channel_names.append(channel)
+    combined_shape = (
+        len(frame_files["images"]) + len(label_files),
+        *zstack_shape,
+    )
+    combined_channel_names = [*frame_files["images"], *label_files]
+    tile = _tiff_tile(combined_shape)
+
+    def iter_combined_tiles() -> Iterator[np.ndarray]:
+        # lazily read images and then labels as each channel is written
+        stacks = chain(
+            (_read_zstack(files, executor) for files in frame_files["images"].values()),
+            (_read_label_volume(file.path) for file in label_files.values()),
+        )
+        for stack in stacks:
+            yield from _iter_tiles(stack, tile)
 
-    # Collect label data
-    if label_dir:
-        for compartment_name, stack in frame_zstacks["labels"].items():
-            labels_data.append(stack)
-            label_names.append(compartment_name)
-
-    # Stack the images and labels along a new axis for channels
-    images_data = np.stack(images_data, axis=0)
-    if labels_data:
-        labels_data = np.stack(labels_data, axis=0)
-        combined_data = np.concatenate((images_data, labels_data), axis=0)
-        combined_channel_names = channel_names + label_names
-    else:
-        combined_data = images_data
-        combined_channel_names = channel_names
+            # release the stack before reading the next channel
+            del stack
 
     # Generate OME-XML metadata
     ome_metadata = {
-        "SizeC": combined_data.shape[0],
-        "SizeZ": combined_data.shape[1],
-        "SizeY": combined_data.shape[2],
-        "SizeX": combined_data.shape[3],
+        "SizeC": combined_shape[0],
+        "SizeZ": combined_shape[1],
+        "SizeY": combined_shape[2],
+        "SizeX": combined_shape[3],
         "PhysicalSizeX": scaling_values[2],
         "PhysicalSizeY": scaling_values[1],
         "PhysicalSizeZ": scaling_values[0],
@@ -323,8 +606,27 @@ def tiff_to_ometiff(  # noqa: PLR0913
     }
     ome_xml = generate_ome_xml(ome_metadata)
 
-    # Write the combined data to a single OME-TIFF
-    with tiff.TiffWriter(output_path, bigtiff=True) as tif:
-        tif.write(combined_data, description=ome_xml, photometric="minisblack")
+    # Write the combined data to a single compressed OME-TIFF, streaming
+    # tiles so that only one channel is read into memory at a time
+    try:
+        with (
+            ThreadPoolExecutor(max_workers=MAX_READ_WORKERS) as executor,
+            tiff.TiffWriter(output_path, bigtiff=True) as tif,
+        ):
+            tif.write(
+                iter_combined_tiles(),
+                shape=combined_shape,
+                dtype=np.uint16,
+                description=ome_xml,
+                photometric="minisblack",
+                # write tiles rather than strips for random access to regions
+                tile=tile,
+                compression="zlib",
+                compressionargs={"level": 5},
+            )
+    except Exception:
+        # remove any partially written file so the output path may be reused
+        pathlib.Path(output_path).unlink(missing_ok=True)
+        raise
 
     return output_path
@@ -2,11 +2,16 @@
 Viewing utilities for GFF 3D organoid project
 """
 
+import functools
+import os
 import re
 import xml.etree.ElementTree as ET
 from typing import Dict, Optional, Tuple
 from xml.etree.ElementTree import Element, SubElement, tostring
 
+# pattern for z-slice numbers within filenames, e.g. '_ZS034_'
+_ZS_RE = re.compile(r"_ZS(\d+)_")
+
 
 def extract_z_slice_number_from_filename(filename: str) -> int:
     """
@@ -27,10 +32,66 @@ def extract_z_slice_number_from_filename(filename: str) -> int:
         int:
             The extracted z-slice number. Returns 0 if the pattern is not found.
     """
-    match = re.search(r"_ZS(\d+)_", filename)
+    match = _ZS_RE.search(filename)
     return int(match.group(1)) if match else 0
 
 
+@functools.lru_cache(maxsize=32)
+def _parse_scaninfoxml(
+    xml_file: str, _mtime_ns: int, _size: int
+) -> Tuple[Optional[float], Optional[float], Optional[float]]:
+    """
+    Parses scaling values from a ScanInfo.xml file.
+
+    Args:
+        xml_file (str):
+            Absolute path to the XML file.
+        _mtime_ns (int):
+            Modification time of the file in nanoseconds.
+            Unused within the function and only serves as
+            a cache key so that changes to the file are
+            picked up.
+        _size (int):
+            Size of the file in bytes. Unused within the
+            function and only serves as a cache key.
+
+    Returns:
+        Tuple[Optional[float], Optional[float], Optional[float]]:
+            A tuple containing the values of
+            ZStackSpacingMicrons, MicronsPerPixelY,
+            and MicronsPerPixelX. If a value is not found,
+            it will be None.
+    """
+    microns_per_pixel_y: Optional[float] = None
+    microns_per_pixel_x: Optional[float] = None
+    z_stack_spacing_microns: Optional[float] = None
+
+    # stream through the file instead of building the full tree
+    # so that we may stop as soon as all values have been found
+    with open(xml_file, "rb") as file:
+        for _, element in ET.iterparse(file, events=("end",)):
+            if element.tag == "Setting":
+                param = element.get("Parameter")
+                if param == "MicronsPerPixelY":
+                    microns_per_pixel_y = float(element.text)
+                elif param == "MicronsPerPixelX":
+                    microns_per_pixel_x = float(element.text)
+                elif param == "ZStackSpacingMicrons":
+                    z_stack_spacing_microns = float(element.text)
+
+                if None not in (
+                    microns_per_pixel_y,
+                    microns_per_pixel_x,
+                    z_stack_spacing_microns,
+                ):
+                    break
+
+            # release elements which have already been inspected
+            element.clear()
+
+    return (z_stack_spacing_microns, microns_per_pixel_y, microns_per_pixel_x)
+
+
 def gather_scaling_info_from_scaninfoxml(
     xml_file: str,
 ) -> Tuple[Optional[float], Optional[float], Optional[float]]:
@@ -54,24 +115,12 @@ def gather_scaling_info_from_scaninfoxml(
             ZStackSpacingMicrons, MicronsPerPixelY,
             and MicronsPerPixelX. If a value is not found,
             it will be None.
-    """
-    tree = ET.parse(xml_file)
-    root = tree.getroot()
 
-    microns_per_pixel_y: Optional[float] = None
-    microns_per_pixel_x: Optional[float] = None
-    z_stack_spacing_microns: Optional[float] = None
-
-    for setting in root.findall(".//Setting"):
-        param = setting.get("Parameter")
-        if param == "MicronsPerPixelY":
-            microns_per_pixel_y = float(setting.text)
-        elif param == "MicronsPerPixelX":
-            microns_per_pixel_x = float(setting.text)
-        elif param == "ZStackSpacingMicrons":
-            z_stack_spacing_microns = float(setting.text)
-
-    return (z_stack_spacing_microns, microns_per_pixel_y, microns_per_pixel_x)
+    Results are cached by path, modification time and size
+    so that repeat calls for an unchanged file skip parsing.
+    """
+    stat = os.stat(xml_file)
+    return _parse_scaninfoxml(os.path.abspath(xml_file), stat.st_mtime_ns, stat.st_size)
 
 
 def generate_ome_xml(metadata: Dict) -> str:
@@ -3,11 +3,12 @@ Utilities for viewing n-dimensional data
 """
 
 import logging
+import xml.etree.ElementTree as ET
 from typing import Optional
 
+import dask.array as da
 import napari
 import tifffile as tiff
-import xmltodict
 import zarr
 
 logger = logging.getLogger(__name__)
@@ -40,19 +41,22 @@ def view_zarr_with_napari(
     # Visualize with napari, start in 3d mode
     viewer = napari.Viewer(ndisplay=3)
 
-    # Iterate through each channel in the Zarr file
-    for channel_name in sorted(frame_zarr["images"].keys(), reverse=True):
+    # Iterate through each channel in the Zarr file, handing napari
+    # lazy arrays so that chunks are only read when displayed
+    images_group = frame_zarr["images"]
+    for channel_name in sorted(images_group.keys(), reverse=True):
         viewer.add_image(
-            frame_zarr["images"][channel_name]["0"][:],
+            da.from_zarr(images_group[channel_name]["0"]),
             name=channel_name,
             scale=scaling_values,
         )
 
     # Iterate through each compartment in the Zarr file and add labels to Napari
     if "labels" in frame_zarr:
-        for label_name in sorted(frame_zarr["labels"].keys(), reverse=True):
+        labels_group = frame_zarr["labels"]
+        for label_name in sorted(labels_group.keys(), reverse=True):
             viewer.add_labels(
-                frame_zarr["labels"][label_name]["0"][:],
+                da.from_zarr(labels_group[label_name]["0"]),
                 name=f"{label_name}",
                 scale=scaling_values,
             )
@@ -94,36 +98,41 @@ def view_ometiff_with_napari(
     # Visualize with napari, start in 3d mode
     viewer = napari.Viewer(ndisplay=3)
 
-    # Read and add layers from the combined OME-TIFF file
+    # Read the combined OME-TIFF file lazily through a Zarr store
+    # so that napari only reads the tiles which it displays
+    combined_data = da.from_zarr(tiff.imread(ometiff_path, aszarr=True))
+
     with tiff.TiffFile(ometiff_path) as tif:
-        combined_data = tif.asarray()
-        metadata = xmltodict.parse(tif.ome_metadata)
+        # find channel names directly rather than converting all metadata
         channel_names = [
-            channel["@Name"]
-            for channel in metadata["OME"]["Image"]["Pixels"]["Channel"]
+            channel.get("Name")
+            for channel in ET.fromstring(tif.ome_metadata).iterfind(".//{*}Channel")
         ]
 
-        # First, add image layers
-        for i, (channel_data, channel_name) in enumerate(
-            zip(combined_data, channel_names)
-        ):
-            if "(labels)" not in channel_name:
-                viewer.add_image(
-                    channel_data,
-                    name=channel_name,
-                    scale=scaling_values,
-                )
-
-        # Then, add label layers
-        for i, (channel_data, channel_name) in enumerate(
-            zip(combined_data, channel_names)
-        ):
-            if "(labels)" in channel_name:
-                viewer.add_labels(
-                    channel_data,
-                    name=channel_name,
-                    scale=scaling_values,
-                )
+    # split channel indices into images and labels in a single pass
+    image_indices = []
+    label_indices = []
+    for i, channel_name in enumerate(channel_names):
+        if "(labels)" in channel_name:
+            label_indices.append(i)
+        else:
+            image_indices.append(i)
+
+    # First, add image layers
+    for i in image_indices:
+        viewer.add_image(
+            combined_data[i],
+            name=channel_names[i],
+            scale=scaling_values,
+        )
+
+    # Then, add label layers
+    for i in label_indices:
+        viewer.add_labels(
+            combined_data[i],
+            name=channel_names[i],
+            scale=scaling_values,
+        )
 
     if not headless:
         # Start the Napari event loop
@@ -38,14 +38,13 @@ scaling_values = (1.0, 0.1, 0.1)  # (z, y, x) in microns
 num_z_slices = 10
 image_shape = (100, 100)  # Example shape, adjust as needed
 
-# create random data for each channel
-channels = {
-    channel: [
-        np.random.randint(0, 65535, size=image_shape, dtype=np.uint16)
-        for _ in range(num_z_slices)
-    ]
-    for channel in channels
-}
+# create random data for all channels in a single (c, z, y, x) fill
+# using a fixed seed so that regenerated data is reproducible
+rng = np.random.default_rng(0)
+data = rng.integers(
+    0, 65535, size=(len(channels), num_z_slices, *image_shape), dtype=np.uint16
+)
+channels = dict(zip(channels, data))
 
 # Debug: show channel keys and file counts
 print(channels.keys())
@@ -7,12 +7,13 @@ import xml.etree.ElementTree as ET
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 
+import numpy as np
 import pytest
 import tifffile as tiff
 import zarr
 
 from nviz.image import image_set_to_arrays, tiff_to_ometiff, tiff_to_zarr
-from tests.utils import example_data_for_image_tests
+from tests.utils import example_data_for_image_tests, write_zstack_slices
 
 
 @pytest.mark.parametrize(
@@ -45,6 +46,67 @@ def test_image_set_to_arrays(
         assert all(ignored not in result["images"] for ignored in ignore)
 
 
+def test_image_set_to_arrays_values(tmp_path: pathlib.Path):
+    """
+    Tests that image_set_to_arrays reads slices in z order
+    and casts non-uint16 slices to uint16.
+    """
+
+    rng = np.random.default_rng(0)
+    zstacks = {
+        "111": rng.integers(0, 65535, size=(4, 30, 40), dtype=np.uint16),
+        "222": rng.integers(0, 255, size=(4, 30, 40), dtype=np.uint8),
+    }
+    write_zstack_slices(tmp_path / "images", zstacks)
+
+    result = image_set_to_arrays(
+        image_dir=str(tmp_path / "images"),
+        channel_map={"111": "Channel A", "222": "Channel B"},
+    )
+
+    for code, channel in (("111", "Channel A"), ("222", "Channel B")):
+        assert result["images"][channel].dtype == np.uint16
+        assert np.array_equal(result["images"][channel], zstacks[code])
+
+
+@pytest.mark.parametrize("compression", [None, "zlib"])
+def test_label_volumes(compression: Optional[str], tmp_path: pathlib.Path):
+    """
+    Tests reading label volumes which may or may not be
+    memory-mapped depending on their compression.
+    """
+
+    # write a copy of the example labels with the given compression
+    label_dir = tmp_path / "labels"
+    label_dir.mkdir()
+    labels = tiff.imread("tests/data/random_tiff_z_stacks/labels/compartment.tif")
+    tiff.imwrite(label_dir / "compartment.tif", labels, compression=compression)
+
+    result = image_set_to_arrays(
+        image_dir="tests/data/random_tiff_z_stacks/Z99",
+        label_dir=str(label_dir),
+        channel_map={"111": "Channel A"},
+    )
+
+    # check that labels are returned as writable in-memory arrays
+    label_array = result["labels"]["compartment (labels)"]
+    assert type(label_array) is np.ndarray
+    assert np.array_equal(label_array, labels)
+    label_array[0, 0, 0] = 1
+
+    output_path = tiff_to_zarr(
+        image_dir="tests/data/random_tiff_z_stacks/Z99",
+        label_dir=str(label_dir),
+        output_path=f"{tmp_path}/output.zarr",
+        channel_map={"111": "Channel A"},
+        scaling_values=(1.0, 0.1, 0.1),
+    )
+
+    # check that the full resolution labels were written unchanged
+    zarr_root = zarr.open(output_path, mode="r")
+    assert np.array_equal(zarr_root["labels"]["compartment (labels)"]["0"][:], labels)
+
+
 @pytest.mark.parametrize(
     (
         "image_dir, label_dir, output_path, channel_map, "
@@ -92,6 +154,14 @@ def test_tiff_to_zarr(
         ]:
             assert channel in list(zarr_root["images"])
 
+    # check that each channel was written as a multiscale pyramid
+    for channel in zarr_root["images"]:
+        datasets = zarr_root["images"][channel].attrs["multiscales"][0]["datasets"]
+        assert len(datasets) > 1
+        assert all(
+            dataset["path"] in zarr_root["images"][channel] for dataset in datasets
+        )
+
     # check if we have labels if we supplied them
     if label_dir is not None:
         assert all(
@@ -99,6 +169,43 @@ def test_tiff_to_zarr(
             for expected_label in expected_labels
         )
 
+        # check that downsampled label layers halve y and x
+        # while only containing values from the full resolution layer
+        for label in zarr_root["labels"]:
+            full = zarr_root["labels"][label]["0"][:]
+            downsampled = zarr_root["labels"][label]["1"][:]
+            assert downsampled.shape == (
+                full.shape[0],
+                full.shape[1] // 2,
+                full.shape[2] // 2,
+            )
+            assert set(np.unique(downsampled)) <= set(np.unique(full))
+
+
+def test_tiff_to_zarr_values(tmp_path: pathlib.Path):
+    """
+    Tests that each channel written by tiff_to_zarr holds its own data.
+    """
+
+    rng = np.random.default_rng(0)
+    zstacks = {
+        code: rng.integers(0, 65535, size=(4, 30, 40), dtype=np.uint16)
+        for code in ("111", "222", "333")
+    }
+    write_zstack_slices(tmp_path / "images", zstacks)
+    channel_map = {"111": "Channel A", "222": "Channel B", "333": "Channel C"}
+
+    output_path = tiff_to_zarr(
+        image_dir=str(tmp_path / "images"),
+        output_path=f"{tmp_path}/output.zarr",
+        channel_map=channel_map,
+        scaling_values=(1.0, 0.1, 0.1),
+    )
+
+    zarr_root = zarr.open(output_path, mode="r")
+    for code, channel in channel_map.items():
+        assert np.array_equal(zarr_root["images"][channel]["0"][:], zstacks[code])
+
 
 @pytest.mark.parametrize(
     (
@@ -159,3 +266,72 @@ def test_tiff_to_ometiff(
         assert pixels.get("PhysicalSizeX") == str(scaling_values[2])
         assert pixels.get("PhysicalSizeY") == str(scaling_values[1])
         assert pixels.get("PhysicalSizeZ") == str(scaling_values[0])
+
+
+def test_tiff_to_ometiff_mismatched_shapes(tmp_path: pathlib.Path):
+    """
+    Tests that tiff_to_ometiff raises on mismatched channel
+    shapes without leaving a partial file behind.
+    """
+
+    label_dir = tmp_path / "labels"
+    label_dir.mkdir()
+    tiff.imwrite(label_dir / "compartment.tif", np.zeros((2, 20, 20), dtype=np.uint16))
+    output_path = tmp_path / "output.ome.tiff"
+
+    with pytest.raises(ValueError, match="does not match the expected shape"):
+        tiff_to_ometiff(
+            image_dir="tests/data/random_tiff_z_stacks/Z99",
+            label_dir=str(label_dir),
+            output_path=str(output_path),
+            channel_map={"111": "Channel A"},
+            scaling_values=(1.0, 0.1, 0.1),
+        )
+
+    assert not output_path.exists()
+
+
+def test_tiff_to_ometiff_no_channels(tmp_path: pathlib.Path):
+    """
+    Tests that tiff_to_ometiff raises when all channels are ignored.
+    """
+
+    with pytest.raises(ValueError, match="No image channels found"):
+        tiff_to_ometiff(
+            image_dir="tests/data/random_tiff_z_stacks/Z99",
+            output_path=f"{tmp_path}/output.ome.tiff",
+            channel_map={"111": "Channel A"},
+            scaling_values=(1.0, 0.1, 0.1),
+            ignore=["111", "222", "333", "444", "555"],
+        )
+
+
+def test_tiff_to_ometiff_values(tmp_path: pathlib.Path):
+    """
+    Tests that tiff_to_ometiff writes image and label data unchanged,
+    using a (y, x) shape which is not a multiple of the tile size.
+    """
+
+    rng = np.random.default_rng(0)
+    zstacks = {
+        code: rng.integers(0, 65535, size=(2, 600, 700), dtype=np.uint16)
+        for code in ("111", "222")
+    }
+    write_zstack_slices(tmp_path / "images", zstacks)
+
+    label_dir = tmp_path / "labels"
+    label_dir.mkdir()
+    labels = rng.integers(0, 10, size=(2, 600, 700), dtype=np.uint16)
+    tiff.imwrite(label_dir / "compartment.tif", labels)
+
+    output_path = tiff_to_ometiff(
+        image_dir=str(tmp_path / "images"),
+        label_dir=str(label_dir),
+        output_path=f"{tmp_path}/output.ome.tiff",
+        channel_map={"111": "Channel A", "222": "Channel B"},
+        scaling_values=(1.0, 0.1, 0.1),
+    )
+
+    assert np.array_equal(
+        tiff.imread(output_path), np.stack([zstacks["111"], zstacks["222"], labels])
+    )
@@ -108,6 +108,24 @@ def test_gather_scaling_info_from_scaninfoxml(
     assert gather_scaling_info_from_scaninfoxml(xml_file) == expected
 
 
+def test_gather_scaling_info_from_scaninfoxml_modified(tmp_path: pathlib.Path):
+    """
+    Tests gather_scaling_info_from_scaninfoxml picks up
+    changes to a file which was previously read.
+    """
+
+    xml_file = tmp_path / "temp_scaninfo.xml"
+    xml_file.write_text(
+        '<Root><Setting Parameter="ZStackSpacingMicrons">1.0</Setting></Root>'
+    )
+    assert gather_scaling_info_from_scaninfoxml(xml_file) == (1.0, None, None)
+
+    xml_file.write_text(
+        '<Root><Setting Parameter="ZStackSpacingMicrons">10.5</Setting></Root>'
+    )
+    assert gather_scaling_info_from_scaninfoxml(xml_file) == (10.5, None, None)
+
+
 @pytest.mark.parametrize(
     "metadata, expected_channels",
     [
@@ -2,6 +2,12 @@
 Utilities for testing.
 """
 
+import pathlib
+from typing import Dict
+
+import numpy as np
+import tifffile as tiff
+
 # data examples for use with pytest parameterized tests
 # (creating a data value here because it's simpler to use
 # than a fixture inside parameterized tests).
@@ -55,3 +61,22 @@ example_data_for_image_tests = [
         ["compartment (labels)"],
     ),
 ]
+
+
+def write_zstack_slices(image_dir: pathlib.Path, zstacks: Dict[str, np.ndarray]):
+    """
+    Write z-stacks as individual z-slice TIFF files.
+
+    Args:
+        image_dir (pathlib.Path):
+            Directory to write the z-slice files to.
+        zstacks (Dict[str, np.ndarray]):
+            Mapping from filename codes to (z, y, x) arrays.
+    """
+    image_dir.mkdir()
+    for code, zstack in zstacks.items():
+        # write slices in reverse so that reads must be ordered by z
+        for z_index in reversed(range(len(zstack))):
+            tiff.imwrite(
+                image_dir / f"Z99_{code}_ZS{z_index:03d}_.tif", zstack[z_index]
+            )